@@ -1,201 +1,350 @@
 import sqlite3
-from contextlib import closing
+import threading
 from datetime import date
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 DB_PATH = "employees.db"
+ORDINAL_EPOCH_JULIAN_DAY = 1721424.5
+
+DATE_COLUMNS = {
+    "employees": "start_date",
+    "work_hours": "work_date",
+    "adjustments": "adjustment_date",
+}
+
+CREATE_ALL_SQL = """
+CREATE TABLE IF NOT EXISTS employees (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    full_name TEXT NOT NULL,
+    role_title TEXT NOT NULL,
+    hourly_rate REAL NOT NULL,
+    start_date INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS work_hours (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INTEGER NOT NULL,
+    work_date INTEGER NOT NULL,
+    hours REAL NOT NULL,
+    notes TEXT,
+    FOREIGN KEY (employee_id) REFERENCES employees (id)
+);
+
+CREATE TABLE IF NOT EXISTS adjustments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INTEGER NOT NULL,
+    adjustment_date INTEGER NOT NULL,
+    adjustment_type TEXT NOT NULL,
+    amount REAL NOT NULL,
+    description TEXT,
+    FOREIGN KEY (employee_id) REFERENCES employees (id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (full_name);
+
+CREATE INDEX IF NOT EXISTS idx_wh_date_emp
+ON work_hours (work_date, employee_id, hours);
+
+CREATE INDEX IF NOT EXISTS idx_wh_emp ON work_hours (employee_id);
+
+CREATE INDEX IF NOT EXISTS idx_adj_date_emp_type
+ON adjustments (adjustment_date, employee_id, adjustment_type, amount);
+"""
+
+SQL_INSERT_EMPLOYEE = """
+INSERT INTO employees (full_name, role_title, hourly_rate, start_date)
+VALUES (?, ?, ?, ?)
+"""
+
+SQL_INSERT_WORK_HOURS = """
+INSERT INTO work_hours (employee_id, work_date, hours, notes)
+VALUES (?, ?, ?, ?)
+"""
+
+SQL_INSERT_ADJUSTMENT = """
+INSERT INTO adjustments (
+    employee_id, adjustment_date, adjustment_type, amount, description
+)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+SQL_SELECT_EMPLOYEE_NAMES = "SELECT id, full_name FROM employees ORDER BY full_name"
+
+SQL_SELECT_EMPLOYEES = f"""
+SELECT id, full_name, role_title, hourly_rate,
+       date(start_date + {ORDINAL_EPOCH_JULIAN_DAY}) AS start_date
+FROM employees
+"""
+
+SQL_WORK_HOURS_DETAIL = f"""employees.full_name,
+       date(work_hours.work_date + {ORDINAL_EPOCH_JULIAN_DAY}) AS work_date,
+       work_hours.hours, work_hours.notes
+FROM work_hours
+JOIN employees ON employees.id = work_hours.employee_id
+WHERE work_hours.work_date BETWEEN ? AND ?
+ORDER BY work_hours.work_date
+"""
+
+SQL_SELECT_WORK_HOURS = "\nSELECT " + SQL_WORK_HOURS_DETAIL
+
+SQL_SELECT_WORK_HOURS_WITH_IDS = (
+    "\nSELECT work_hours.id, work_hours.employee_id, " + SQL_WORK_HOURS_DETAIL
+)
+
+SQL_ADJUSTMENTS_DETAIL = f"""employees.full_name,
+       date(adjustments.adjustment_date + {ORDINAL_EPOCH_JULIAN_DAY})
+           AS adjustment_date,
+       adjustments.adjustment_type,
+       adjustments.amount, adjustments.description
+FROM adjustments
+JOIN employees ON employees.id = adjustments.employee_id
+WHERE adjustments.adjustment_date BETWEEN ? AND ?
+ORDER BY adjustments.adjustment_date
+"""
+
+SQL_SELECT_ADJUSTMENTS = "\nSELECT " + SQL_ADJUSTMENTS_DETAIL
+
+SQL_SELECT_ADJUSTMENTS_WITH_IDS = (
+    "\nSELECT adjustments.id, adjustments.employee_id, " + SQL_ADJUSTMENTS_DETAIL
+)
+
+SQL_SELECT_PAYROLL = """
+SELECT e.full_name, e.hourly_rate,
+       COALESCE(h.total_hours, 0.0) AS total_hours,
+       COALESCE(a.bonus_total, 0.0) AS bonus_total,
+       COALESCE(a.deduction_total, 0.0) AS deduction_total
+FROM employees e
+LEFT JOIN (
+    SELECT employee_id, SUM(hours) AS total_hours
+    FROM work_hours
+    WHERE work_date BETWEEN ? AND ?
+    GROUP BY employee_id
+) h ON h.employee_id = e.id
+LEFT JOIN (
+    SELECT employee_id,
+           SUM(CASE WHEN adjustment_type = 'bonus' THEN amount ELSE 0 END)
+               AS bonus_total,
+           SUM(CASE WHEN adjustment_type = 'deduction' THEN amount ELSE 0 END)
+               AS deduction_total
+    FROM adjustments
+    WHERE adjustment_date BETWEEN ? AND ?
+    GROUP BY employee_id
+) a ON a.employee_id = e.id
+ORDER BY e.full_name
+"""
+
+sqlite3.register_adapter(date, date.toordinal)
+
+
+@st.cache_resource
+def _write_lock():
+    return threading.Lock()
+
+
+_LOCK = _write_lock()
+
+
+@st.cache_resource
+def _employees_version():
+    return {"value": 0}
+
+
+_EMP_VERSION = _employees_version()
+
+
+@st.cache_resource
+def get_connection():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    return conn
+
+
+def _legacy_date_tables(conn):
+    legacy = []
+    for table, column in DATE_COLUMNS.items():
+        types = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if types.get(column) == "TEXT":
+            legacy.append(table)
+    return legacy
+
+
+def _migrate_legacy_date_tables(conn, legacy):
+    conn.execute("PRAGMA legacy_alter_table=ON")
+    try:
+        with conn:
+            cur = conn.cursor()
+            cur.execute("BEGIN")
+            for table in legacy:
+                cur.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+                indexes = cur.execute(
+                    """
+                    SELECT name FROM sqlite_master
+                    WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL
+                    """,
+                    (f"{table}_legacy",),
+                ).fetchall()
+                for (index,) in indexes:
+                    cur.execute(f"DROP INDEX {index}")
+
+            for statement in CREATE_ALL_SQL.split(";"):
+                if statement.strip():
+                    cur.execute(statement)
+
+            for table in legacy:
+                date_column = DATE_COLUMNS[table]
+                columns = [row[1] for row in cur.execute(f"PRAGMA table_info({table})")]
+                values = [
+                    f"CAST(julianday({column}) - {ORDINAL_EPOCH_JULIAN_DAY} AS INTEGER)"
+                    if column == date_column
+                    else column
+                    for column in columns
+                ]
+                cur.execute(
+                    f"INSERT INTO {table} ({', '.join(columns)}) "
+                    f"SELECT {', '.join(values)} FROM {table}_legacy"
+                )
+            for table in legacy:
+                cur.execute(f"DROP TABLE {table}_legacy")
+    finally:
+        conn.execute("PRAGMA legacy_alter_table=OFF")
+
+
+@st.cache_resource
+def init_db():
+    conn = get_connection()
+    with _LOCK:
+        legacy = _legacy_date_tables(conn)
+        if legacy:
+            _migrate_legacy_date_tables(conn, legacy)
+        else:
+            conn.executescript(CREATE_ALL_SQL)
 
 
-def get_connection():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+def _bulk_add_employees(rows):
+    conn = get_connection()
+    with _LOCK, conn:
+        conn.execute("BEGIN")
+        conn.executemany(SQL_INSERT_EMPLOYEE, rows)
+        _EMP_VERSION["value"] += 1
+    load_employee_names.clear()
+    load_work_hours.clear()
+    load_adjustments.clear()
+    calculate_payroll.clear()
 
 
-def init_db():
-    with closing(get_connection()) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS employees (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                full_name TEXT NOT NULL,
-                role_title TEXT NOT NULL,
-                hourly_rate REAL NOT NULL,
-                start_date TEXT NOT NULL
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS work_hours (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                work_date TEXT NOT NULL,
-                hours REAL NOT NULL,
-                notes TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees (id)
-            )
-            """
-        )
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS adjustments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_id INTEGER NOT NULL,
-                adjustment_date TEXT NOT NULL,
-                adjustment_type TEXT NOT NULL,
-                amount REAL NOT NULL,
-                description TEXT,
-                FOREIGN KEY (employee_id) REFERENCES employees (id)
-            )
-            """
-        )
-        conn.commit()
+def _bulk_add_work_hours(rows):
+    conn = get_connection()
+    with _LOCK, conn:
+        conn.execute("BEGIN")
+        conn.executemany(SQL_INSERT_WORK_HOURS, rows)
+    load_work_hours.clear()
+    calculate_payroll.clear()
+
+
+def _bulk_add_adjustments(rows):
+    conn = get_connection()
+    with _LOCK, conn:
+        conn.execute("BEGIN")
+        conn.executemany(SQL_INSERT_ADJUSTMENT, rows)
+    load_adjustments.clear()
+    calculate_payroll.clear()
 
 
 def add_employee(full_name, role_title, hourly_rate, start_date):
-    with closing(get_connection()) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO employees (full_name, role_title, hourly_rate, start_date)
-            VALUES (?, ?, ?, ?)
-            """,
-            (full_name, role_title, hourly_rate, start_date.isoformat()),
-        )
-        conn.commit()
+    _bulk_add_employees([(full_name, role_title, hourly_rate, start_date)])
 
 
 def add_work_hours(employee_id, work_date, hours, notes):
-    with closing(get_connection()) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO work_hours (employee_id, work_date, hours, notes)
-            VALUES (?, ?, ?, ?)
-            """,
-            (employee_id, work_date.isoformat(), hours, notes),
-        )
-        conn.commit()
+    _bulk_add_work_hours([(employee_id, work_date, hours, notes)])
 
 
 def add_adjustment(employee_id, adjustment_date, adjustment_type, amount, description):
-    with closing(get_connection()) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO adjustments (
-                employee_id, adjustment_date, adjustment_type, amount, description
-            )
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                employee_id,
-                adjustment_date.isoformat(),
-                adjustment_type,
-                amount,
-                description,
-            ),
-        )
-        conn.commit()
+    _bulk_add_adjustments(
+        [(employee_id, adjustment_date, adjustment_type, amount, description)]
+    )
+
+
+def _read_frame(sql, params=(), dtypes=None):
+    cur = get_connection().execute(sql, params)
+    rows = cur.fetchall()
+    frame = pd.DataFrame.from_records(
+        rows, columns=[column[0] for column in cur.description]
+    )
+    if dtypes:
+        frame = frame.astype(dtypes, copy=False)
+    return frame
 
 
 def load_employees():
-    with closing(get_connection()) as conn:
-        return pd.read_sql_query(
-            "SELECT id, full_name, role_title, hourly_rate, start_date FROM employees",
-            conn,
-        )
+    return _read_frame(
+        SQL_SELECT_EMPLOYEES,
+        dtypes={"id": "int64", "hourly_rate": "float64"},
+    )
 
 
-def load_work_hours(start_date, end_date):
-    with closing(get_connection()) as conn:
-        return pd.read_sql_query(
-            """
-            SELECT work_hours.id, employees.full_name, work_hours.employee_id,
-                   work_hours.work_date, work_hours.hours, work_hours.notes
-            FROM work_hours
-            JOIN employees ON employees.id = work_hours.employee_id
-            WHERE work_hours.work_date BETWEEN ? AND ?
-            ORDER BY work_hours.work_date
-            """,
-            conn,
-            params=(start_date.isoformat(), end_date.isoformat()),
-        )
+@st.cache_resource(max_entries=1)
+def _employees_cached(version):
+    return load_employees()
 
 
-def load_adjustments(start_date, end_date):
-    with closing(get_connection()) as conn:
-        return pd.read_sql_query(
-            """
-            SELECT adjustments.id, employees.full_name, adjustments.employee_id,
-                   adjustments.adjustment_date, adjustments.adjustment_type,
-                   adjustments.amount, adjustments.description
-            FROM adjustments
-            JOIN employees ON employees.id = adjustments.employee_id
-            WHERE adjustments.adjustment_date BETWEEN ? AND ?
-            ORDER BY adjustments.adjustment_date
-            """,
-            conn,
-            params=(start_date.isoformat(), end_date.isoformat()),
-        )
+@st.cache_data(ttl=300, show_spinner=False)
+def load_employee_names():
+    cur = get_connection().cursor()
+    cur.row_factory = sqlite3.Row
+    cur.execute(SQL_SELECT_EMPLOYEE_NAMES)
+    return {row["id"]: row["full_name"] for row in cur}
 
 
-def calculate_payroll(start_date, end_date):
-    with closing(get_connection()) as conn:
-        employees = pd.read_sql_query(
-            "SELECT id, full_name, hourly_rate FROM employees", conn
-        )
-        if employees.empty:
-            return pd.DataFrame()
-
-        hours = pd.read_sql_query(
-            """
-            SELECT employee_id, SUM(hours) AS total_hours
-            FROM work_hours
-            WHERE work_date BETWEEN ? AND ?
-            GROUP BY employee_id
-            """,
-            conn,
-            params=(start_date.isoformat(), end_date.isoformat()),
-        )
+@st.cache_data(ttl=300, show_spinner=False)
+def load_work_hours(start_date, end_date, include_ids=False):
+    return _read_frame(
+        SQL_SELECT_WORK_HOURS_WITH_IDS if include_ids else SQL_SELECT_WORK_HOURS,
+        (start_date, end_date),
+        dtypes={"hours": "float64"},
+    )
 
-        bonuses = pd.read_sql_query(
-            """
-            SELECT employee_id, SUM(amount) AS bonus_total
-            FROM adjustments
-            WHERE adjustment_date BETWEEN ? AND ?
-              AND adjustment_type = 'bonus'
-            GROUP BY employee_id
-            """,
-            conn,
-            params=(start_date.isoformat(), end_date.isoformat()),
-        )
 
-        deductions = pd.read_sql_query(
-            """
-            SELECT employee_id, SUM(amount) AS deduction_total
-            FROM adjustments
-            WHERE adjustment_date BETWEEN ? AND ?
-              AND adjustment_type = 'deduction'
-            GROUP BY employee_id
-            """,
-            conn,
-            params=(start_date.isoformat(), end_date.isoformat()),
-        )
+@st.cache_data(ttl=300, show_spinner=False)
+def load_adjustments(start_date, end_date, include_ids=False):
+    return _read_frame(
+        SQL_SELECT_ADJUSTMENTS_WITH_IDS if include_ids else SQL_SELECT_ADJUSTMENTS,
+        (start_date, end_date),
+        dtypes={"amount": "float64"},
+    )
 
-    payroll = employees.merge(hours, how="left", left_on="id", right_on="employee_id")
-    payroll = payroll.merge(bonuses, how="left", on="employee_id")
-    payroll = payroll.merge(deductions, how="left", on="employee_id")
 
-    payroll["total_hours"] = payroll["total_hours"].fillna(0)
-    payroll["bonus_total"] = payroll["bonus_total"].fillna(0)
-    payroll["deduction_total"] = payroll["deduction_total"].fillna(0)
-    payroll["gross_pay"] = payroll["total_hours"] * payroll["hourly_rate"]
-    payroll["net_pay"] = (
-        payroll["gross_pay"] + payroll["bonus_total"] - payroll["deduction_total"]
+@st.cache_data(ttl=300, show_spinner=False)
+def calculate_payroll(start_date, end_date):
+    payroll = _read_frame(
+        SQL_SELECT_PAYROLL,
+        (start_date, end_date, start_date, end_date),
+        dtypes={
+            "hourly_rate": "float64",
+            "total_hours": "float64",
+            "bonus_total": "float64",
+            "deduction_total": "float64",
+        },
+    )
+    if payroll.empty:
+        return pd.DataFrame()
+
+    gross_pay = np.empty(len(payroll), dtype="float64")
+    net_pay = np.empty_like(gross_pay)
+    np.multiply(
+        payroll["total_hours"].to_numpy(),
+        payroll["hourly_rate"].to_numpy(),
+        out=gross_pay,
     )
+    np.add(gross_pay, payroll["bonus_total"].to_numpy(), out=net_pay)
+    np.subtract(net_pay, payroll["deduction_total"].to_numpy(), out=net_pay)
+    payroll["gross_pay"] = gross_pay
+    payroll["net_pay"] = net_pay
 
     return payroll[
         [
@@ -207,9 +356,10 @@ def calculate_payroll(start_date, end_date):
             "deduction_total",
             "net_pay",
         ]
-    ].sort_values("full_name")
+    ]
 
 
+@st.fragment
 def render_employee_section(employees):
     st.subheader("Registrar empleado")
     with st.form("employee_form", clear_on_submit=True):
@@ -223,26 +373,30 @@ def render_employee_section(employees):
                 st.error("Completa el nombre y el puesto para continuar.")
             else:
                 add_employee(full_name, role_title, hourly_rate, start_date)
-                st.success("Empleado registrado.")
+                st.session_state.employee_saved = True
+                st.rerun()
+
+    if st.session_state.pop("employee_saved", False):
+        st.success("Empleado registrado.")
 
     if not employees.empty:
         st.dataframe(employees, use_container_width=True)
 
 
-def render_hours_section(employees):
+@st.fragment
+def render_hours_section():
     st.subheader("Registrar horas trabajadas")
-    if employees.empty:
+    employee_names = load_employee_names()
+    if not employee_names:
         st.info("Primero registra al menos un empleado.")
         return
 
     with st.form("hours_form", clear_on_submit=True):
         employee_id = st.selectbox(
             "Empleado",
-            employees["id"],
+            list(employee_names),
             key="hours_employee",
-            format_func=lambda value: employees.loc[
-                employees["id"] == value, "full_name"
-            ].iloc[0],
+            format_func=employee_names.__getitem__,
         )
         work_date = st.date_input("Fecha trabajada", value=date.today())
         hours = st.number_input("Horas", min_value=0.0, step=0.5)
@@ -250,23 +404,27 @@ def render_hours_section(employees):
         submitted = st.form_submit_button("Guardar horas")
         if submitted:
             add_work_hours(employee_id, work_date, hours, notes)
-            st.success("Horas registradas.")
+            st.session_state.hours_saved = True
+            st.rerun()
+
+    if st.session_state.pop("hours_saved", False):
+        st.success("Horas registradas.")
 
 
-def render_adjustments_section(employees):
+@st.fragment
+def render_adjustments_section():
     st.subheader("Registrar bonificaciones o deducciones")
-    if employees.empty:
+    employee_names = load_employee_names()
+    if not employee_names:
         st.info("Primero registra al menos un empleado.")
         return
 
     with st.form("adjustments_form", clear_on_submit=True):
         employee_id = st.selectbox(
             "Empleado",
-            employees["id"],
+            list(employee_names),
             key="adjust_employee",
-            format_func=lambda value: employees.loc[
-                employees["id"] == value, "full_name"
-            ].iloc[0],
+            format_func=employee_names.__getitem__,
         )
         adjustment_date = st.date_input("Fecha del movimiento", value=date.today())
         adjustment_type = st.selectbox("Tipo", ["bonus", "deduction"])
@@ -277,9 +435,14 @@ def render_adjustments_section(employees):
             add_adjustment(
                 employee_id, adjustment_date, adjustment_type, amount, description
             )
-            st.success("Movimiento registrado.")
+            st.session_state.adjustment_saved = True
+            st.rerun()
+
+    if st.session_state.pop("adjustment_saved", False):
+        st.success("Movimiento registrado.")
 
 
+@st.fragment
 def render_payroll_section():
     st.subheader("Resumen de quincena")
     col1, col2 = st.columns(2)
@@ -304,20 +467,27 @@ def render_payroll_section():
     st.dataframe(payroll, use_container_width=True)
     st.metric("Total a depositar", f"$ {payroll['net_pay'].sum():,.2f}")
 
-    hours = load_work_hours(start_date, end_date)
-    adjustments = load_adjustments(start_date, end_date)
+    show_ids = st.checkbox("Mostrar IDs en el detalle", key="show_raw_ids")
 
     with st.expander("Detalle de horas"):
-        if hours.empty:
-            st.write("Sin horas registradas.")
-        else:
-            st.dataframe(hours, use_container_width=True)
+        st.checkbox("Mostrar detalle de horas", key="show_hours_detail")
+        if st.session_state.get("show_hours_detail"):
+            hours = load_work_hours(start_date, end_date, include_ids=show_ids)
+            if hours.empty:
+                st.write("Sin horas registradas.")
+            else:
+                st.dataframe(hours, use_container_width=True)
 
     with st.expander("Detalle de movimientos"):
-        if adjustments.empty:
-            st.write("Sin movimientos registrados.")
-        else:
-            st.dataframe(adjustments, use_container_width=True)
+        st.checkbox("Mostrar detalle de movimientos", key="show_adjustments_detail")
+        if st.session_state.get("show_adjustments_detail"):
+            adjustments = load_adjustments(
+                start_date, end_date, include_ids=show_ids
+            )
+            if adjustments.empty:
+                st.write("Sin movimientos registrados.")
+            else:
+                st.dataframe(adjustments, use_container_width=True)
 
 
 def main():
@@ -328,13 +498,13 @@ def main():
     )
 
     init_db()
-    employees = load_employees()
+    employees = _employees_cached(_EMP_VERSION["value"])
 
     render_employee_section(employees)
     st.divider()
-    render_hours_section(employees)
+    render_hours_section()
     st.divider()
-    render_adjustments_section(employees)
+    render_adjustments_section()
     st.divider()
     render_payroll_section()
 